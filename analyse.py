@@ -1,14 +1,37 @@
 import os
+import re
 import json
 import asyncio
 import aiohttp
 import sys
+import numpy as np
 from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
 import warnings
+# 与信号记录器共用同一套JSON读写（有orjson时使用orjson）
+from signal_recorder import dumps_json, loads_json
 
 # 忽略特定警告
 warnings.filterwarnings("ignore", message="Event loop is closed")
 
+# 信号时间格式固定为 YYYY/MM/DD HH:MM:SS（补零），格式合法时可直接按字符串比较先后
+_match_time_str = re.compile(r'\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2}\Z').match
+
+
+def _parse_time_str(time_str):
+    """将时间字符串转换为datetime对象（标准格式按固定位置切片，不走strptime）"""
+    if not _match_time_str(time_str):
+        return datetime.strptime(time_str, "%Y/%m/%d %H:%M:%S")
+    return datetime(int(time_str[0:4]), int(time_str[5:7]), int(time_str[8:10]),
+                    int(time_str[11:13]), int(time_str[14:16]), int(time_str[17:19]))
+
+
+@lru_cache(maxsize=1 << 16)
+def _time_str_to_ms(time_str):
+    """时间字符串 -> 毫秒时间戳；同一批信号的时间会被多次换算，结果缓存"""
+    return int(_parse_time_str(time_str).timestamp() * 1000)
+
 
 class AsyncReporter:
     def __init__(self):
@@ -69,12 +92,11 @@ class AsyncReporter:
 
     def time_to_ms(self, time_str):
         """将时间字符串转换为毫秒时间戳"""
-        dt = datetime.strptime(time_str, "%Y/%m/%d %H:%M:%S")
-        return int(dt.timestamp() * 1000)
+        return _time_str_to_ms(time_str)
 
     def time_str_to_dt(self, time_str):
         """将时间字符串转换为datetime对象"""
-        return datetime.strptime(time_str, "%Y/%m/%d %H:%M:%S")
+        return _parse_time_str(time_str)
 
     def calculate_rates(self, open_price, high_price, low_price):
         """计算最高和最低的涨跌幅百分比"""
@@ -134,8 +156,8 @@ class AsyncReporter:
         """异步分析JSON文件 - 优化版本，使用gather并发请求"""
         current_file = json_file_path
         try:
-            with open(json_file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            with open(json_file_path, 'rb') as f:
+                data = loads_json(f.read())
 
             print(f"\n{'=' * 60}")
             print(f"📊 开始分析文件: {json_file_path}")
@@ -156,17 +178,11 @@ class AsyncReporter:
                     after_close_time = signal.get("after_close_time")
                     update_time = signal.get("update_time")
 
-                    need_update = False
-                    if after_close_time and update_time:
-                        try:
-                            after_dt = self.time_str_to_dt(after_close_time)
-                            update_dt = self.time_str_to_dt(update_time)
-                            if update_dt <= after_dt:
-                                need_update = True
-                        except:
-                            need_update = True
-                    else:
-                        need_update = True
+                    # 缺少时间或格式不对时都需要更新
+                    need_update = True
+                    if (after_close_time and update_time
+                            and _match_time_str(after_close_time) and _match_time_str(update_time)):
+                        need_update = update_time <= after_close_time
 
                     if need_update:
                         need_update_count += 1
@@ -232,22 +248,22 @@ class AsyncReporter:
             print(f"\n🔄 开始处理K线数据...")
             successful_results = []
             processed_count = 0
+            # 同一批次的信号共用一个更新时间字符串
+            update_time = datetime.now().strftime("%Y/%m/%d %H:%M:%S")
 
             for i, klines in enumerate(klines_results):
                 info = symbol_info_list[i]
 
                 if klines and not isinstance(klines, Exception):
-                    # 转换K线数据格式
-                    kline_list = []
-                    for k in klines:
-                        kline_list.append({
-                            "open_time": k[0],
-                            "open": float(k[1]),
-                            "high": float(k[2]),
-                            "low": float(k[3]),
-                            "close": float(k[4])
-                        })
-                    kline_list.sort(key=lambda x: x["open_time"])
+                    # 转换K线数据为按open_time排序的数组
+                    n = len(klines)
+                    kline_open_times = np.fromiter((k[0] for k in klines), dtype=np.int64, count=n)
+                    kline_highs = np.fromiter((float(k[2]) for k in klines), dtype=np.float64, count=n)
+                    kline_lows = np.fromiter((float(k[3]) for k in klines), dtype=np.float64, count=n)
+                    order = np.argsort(kline_open_times, kind='stable')
+                    kline_open_times = kline_open_times[order]
+                    kline_highs = kline_highs[order]
+                    kline_lows = kline_lows[order]
 
                     # 处理该币种的所有信号
                     for signal in info['signals']:
@@ -260,24 +276,25 @@ class AsyncReporter:
                             start_ms = self.time_to_ms(open_time)
                             end_ms = self.time_to_ms(after_close_time)
 
-                            # 从已获取的K线中筛选时间范围内的数据
-                            filtered_klines = [
-                                k for k in kline_list
-                                if start_ms <= k["open_time"] < end_ms
-                            ]
+                            # 二分定位时间范围 [start_ms, end_ms) 内的K线
+                            lo = np.searchsorted(kline_open_times, start_ms, side='left')
+                            hi = np.searchsorted(kline_open_times, end_ms, side='left')
 
-                            if filtered_klines:
-                                max_high = max(k["high"] for k in filtered_klines)
-                                min_low = min(k["low"] for k in filtered_klines)
+                            if hi > lo:
+                                max_high = float(kline_highs[lo:hi].max())
+                                min_low = float(kline_lows[lo:hi].min())
                                 up_rate, down_rate = self.calculate_rates(open_price, max_high, min_low)
 
-                                result = {
-                                    **signal,
+                                # signal 就是 data 中的原对象，直接更新，保存时无需再按open_time回查
+                                signal.update({
                                     "after_high_price": max_high,
                                     "after_low_price": min_low,
                                     "rate_of_up_change": up_rate,
                                     "rate_of_down_change": down_rate,
-                                    "update_time": datetime.now().strftime("%Y/%m/%d %H:%M:%S"),
+                                    "update_time": update_time
+                                })
+                                result = {
+                                    **signal,
                                     "_symbol": info['symbol'],
                                     "_position_side": position_side
                                 }
@@ -297,24 +314,11 @@ class AsyncReporter:
 
             # ========== 第五步：更新原文件 ==========
             print(f"\n💾 更新JSON文件...")
-            updated_count = 0
-            for res in successful_results:
-                symbol = res['_symbol']
-                for signal in data[symbol]["signals"]:
-                    if signal["open_time"] == res["open_time"]:
-                        signal.update({
-                            "after_high_price": res["after_high_price"],
-                            "after_low_price": res["after_low_price"],
-                            "rate_of_up_change": res["rate_of_up_change"],
-                            "rate_of_down_change": res["rate_of_down_change"],
-                            "update_time": res["update_time"]
-                        })
-                        updated_count += 1
-                        break
+            updated_count = len(successful_results)
 
             # 保存到原文件
-            with open(current_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
+            with open(current_file, 'wb') as f:
+                f.write(dumps_json(data, indent=True))
 
             print(f"\n{'=' * 60}")
             print(f"✅ 分析完成！")
@@ -350,38 +354,27 @@ class AsyncReporter:
         print("📈 信号分析精简报告")
         print("=" * 100)
 
-        # 分离L和S信号
+        # 分离L和S信号（直接使用结果字典，不再另外组装一份）
         l_signals = []
         s_signals = []
 
         for res in successful_results:
-            signal_data = {
-                "symbol": res['_symbol'],
-                "position": res['_position_side'],
-                "open_time": res["open_time"],
-                "open_price": res["open_price"],
-                "after_high": res["after_high_price"],
-                "after_low": res["after_low_price"],
-                "up_rate": res["rate_of_up_change"],
-                "down_rate": res["rate_of_down_change"]
-            }
-
             position = res['_position_side'].upper() if res['_position_side'] else ''
             if position in ['LONG', 'L']:
-                l_signals.append(signal_data)
+                l_signals.append(res)
             else:
-                s_signals.append(signal_data)
+                s_signals.append(res)
 
         # 定义排序函数
         def up_rate_key(s):
             try:
-                return float(s["up_rate"].rstrip('%'))
+                return float(s["rate_of_up_change"].rstrip('%'))
             except:
                 return 0.0
 
         def down_rate_key(s):
             try:
-                return float(s["down_rate"].rstrip('%'))
+                return float(s["rate_of_down_change"].rstrip('%'))
             except:
                 return 0.0
 
@@ -391,54 +384,51 @@ class AsyncReporter:
         # 排序S信号（按下跌%从低到高，即跌幅最大的优先）
         sorted_s = sorted(s_signals, key=down_rate_key)
 
-        # 打印表头
-        print("\n{:<12} {:<8} {:<20} {:<12} {:<12} {:<12} {:<10} {:<10}".format(
+        # 各行先收集到列表，最后一次性输出，避免逐行print
+        lines = []
+        # 信号行模板只构造一次
+        row_fmt = "{:<12} {:<8} {:<20} {:<12.6f} {:<12.6f} {:<12.6f} {:<10} {:<10}".format
+
+        # 表头
+        lines.append("\n{:<12} {:<8} {:<20} {:<12} {:<12} {:<12} {:<10} {:<10}".format(
             "品种", "方向", "开盘时间", "开盘价", "最高价", "最低价", "上涨%", "下跌%"))
-        print("-" * 110)
+        lines.append("-" * 110)
 
-        # 打印L信号（做多）
+        # L信号（做多）
         if sorted_l:
-            print("\n【LONG 信号 - 按上涨%从高到低】")
-            for sig in sorted_l:  # 只显示前20个
-                print("{:<12} {:<8} {:<20} {:<12.6f} {:<12.6f} {:<12.6f} {:<10} {:<10}".format(
-                    sig["symbol"],
-                    "LONG",
-                    sig["open_time"],
-                    sig["open_price"],
-                    sig["after_high"],
-                    sig["after_low"],
-                    sig["up_rate"],
-                    sig["down_rate"]
-                ))
-
-        # 打印S信号（做空）
+            lines.append("\n【LONG 信号 - 按上涨%从高到低】")
+            lines.extend(
+                row_fmt(sig["_symbol"], "LONG", sig["open_time"], sig["open_price"],
+                        sig["after_high_price"], sig["after_low_price"],
+                        sig["rate_of_up_change"], sig["rate_of_down_change"])
+                for sig in sorted_l
+            )
+
+        # S信号（做空）
         if sorted_s:
-            print("\n【SHORT 信号 - 按下跌%从低到高（跌幅最大优先）】")
-            for sig in sorted_s:  # 只显示前20个
-                print("{:<12} {:<8} {:<20} {:<12.6f} {:<12.6f} {:<12.6f} {:<10} {:<10}".format(
-                    sig["symbol"],
-                    "SHORT",
-                    sig["open_time"],
-                    sig["open_price"],
-                    sig["after_high"],
-                    sig["after_low"],
-                    sig["up_rate"],
-                    sig["down_rate"]
-                ))
-
-        # 打印统计信息
-        print(f"\n📊 统计信息")
-        print(f"LONG信号数: {len(sorted_l)}")
-        print(f"SHORT信号数: {len(sorted_s)}")
-        print(f"总计: {len(successful_results)}")
-
-        # 打印最佳表现
+            lines.append("\n【SHORT 信号 - 按下跌%从低到高（跌幅最大优先）】")
+            lines.extend(
+                row_fmt(sig["_symbol"], "SHORT", sig["open_time"], sig["open_price"],
+                        sig["after_high_price"], sig["after_low_price"],
+                        sig["rate_of_up_change"], sig["rate_of_down_change"])
+                for sig in sorted_s
+            )
+
+        # 统计信息
+        lines.append(f"\n📊 统计信息")
+        lines.append(f"LONG信号数: {len(sorted_l)}")
+        lines.append(f"SHORT信号数: {len(sorted_s)}")
+        lines.append(f"总计: {len(successful_results)}")
+
+        # 最佳表现
         if sorted_l:
             best_long = sorted_l[0]
-            print(f"\n🏆 最佳LONG信号: {best_long['symbol']} 上涨 {best_long['up_rate']}")
+            lines.append(f"\n🏆 最佳LONG信号: {best_long['_symbol']} 上涨 {best_long['rate_of_up_change']}")
         if sorted_s:
             best_short = sorted_s[0]
-            print(f"🏆 最佳SHORT信号: {best_short['symbol']} 下跌 {best_short['down_rate']}")
+            lines.append(f"🏆 最佳SHORT信号: {best_short['_symbol']} 下跌 {best_short['rate_of_down_change']}")
+
+        print("\n".join(lines))
 
     async def test_proxy_connection(self):
         """测试代理连接是否正常"""
@@ -520,8 +510,6 @@ def main(json_file_name,history=False):
 
         print("👋 程序退出")
 
-import json
-
 def parse_percent(pct_str):
     """将百分比字符串（如 '+8.84%'）转换为浮点数"""
     return float(pct_str.rstrip('%'))
@@ -529,11 +517,11 @@ def parse_percent(pct_str):
 def system_out(file,history=False):
     # 读取JSON文件
     if not history:
-        with open("signal_data/" + file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open("signal_data/" + file, 'rb') as f:
+            data = loads_json(f.read())
     else:
-        with open("signal_data/history/" + file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        with open("signal_data/history/" + file, 'rb') as f:
+            data = loads_json(f.read())
     # 定义列宽
     widths = [20, 20, 18, 18, 12]
     headers = ['交易对', 'open_time', 'rate_of_up_change', 'rate_of_down_change', 'position_side']
@@ -561,39 +549,28 @@ def system_out(file,history=False):
         if not signals:
             continue
 
-        # 收集有效信号（必须有 rate_of_up_change 且能解析）
-        valid_signals = []
+        # 一次遍历找出上涨率最小和最大的有效信号（必须有 rate_of_up_change 且能解析），保留已解析的上涨率
+        # 并列时最小取最先出现的、最大取最后出现的，与按上涨率稳定升序排序后取首尾一致
+        min_item = max_item = None
         for sig in signals:
-            up_str = sig.get('rate_of_up_change', '')
-            up_val = parse_percent(up_str)
-            if up_val is not None:
-                valid_signals.append((up_val, sig))
-            else:
-                # 无效信号也输出？按照原逻辑，无效可能不打印，这里忽略
-                pass
-
-        if not valid_signals:
+            up_val = parse_percent(sig.get('rate_of_up_change', ''))
+            if up_val is None:
+                continue
+            if min_item is None:
+                min_item = max_item = (up_val, sig)
+            elif up_val < min_item[0]:
+                min_item = (up_val, sig)
+            elif up_val >= max_item[0]:
+                max_item = (up_val, sig)
+
+        if min_item is None:
             continue
 
-        # 排序：按上涨率数值升序
-        valid_signals.sort(key=lambda x: x[0])  # 按 up_val 排序
-
-        # 选择需要输出的信号：最小（第一个）和最大（最后一个）
-        to_output = []
-        if len(valid_signals) == 1:
-            to_output.append(valid_signals[0][1])
-        else:
-            # 去重：如果最小和最大是同一个（所有值相同），只输出一个
-            min_sig = valid_signals[0][1]
-            max_sig = valid_signals[-1][1]
-            if min_sig is max_sig:
-                to_output.append(min_sig)
-            else:
-                to_output.append(min_sig)
-                to_output.append(max_sig)
+        # 只有一个有效信号时只输出一次
+        to_output = [min_item] if min_item[1] is max_item[1] else [min_item, max_item]
 
         # 输出每个选中的信号
-        for sig in to_output:
+        for up_val, sig in to_output:
             open_time = sig.get('open_time', '')
             up_str = sig.get('rate_of_up_change', '')
             down_str = sig.get('rate_of_down_change', '')
@@ -605,9 +582,8 @@ def system_out(file,history=False):
 
             # 着色逻辑
             if side in ('L', 'S'):
-                up_val = parse_percent(up_str)
                 down_val = parse_percent(down_str)
-                if up_val is not None and down_val is not None:
+                if down_val is not None:
                     if side == 'L':
                         condition = up_val > abs(down_val)
                     else:  # side == 'S'
@@ -621,8 +597,6 @@ def system_out(file,history=False):
 # 使用示例
 # system_out("2026-05-02.json")
 if __name__ == '__main__':
-    from datetime import datetime
-
     # 获取当前日期，格式：2026-04-07
     history = 0
 
@@ -55,6 +55,7 @@ class TradingSignalBot:
         self.mouse_operator = MouseOperator()  # 新增
         self.ema_atr_operator = EmaAtrManager()
         self.play_operator = PlaySound()
+        self.symbol_manager: Optional[SymbolManager] = None  # 复用实例以共享交易所信息缓存
 
         self.running = False
         self.last_display_time = time.time()
@@ -282,8 +283,13 @@ class TradingSignalBot:
 
         # ---------- 1. 准备币种列表 ----------
         if not  self.config.POLY_MARKET:
-            manager = SymbolManager(self.config.MIN_VOLUME)
-            symbols: List[str] = manager.get_top_gainers_symbols(*self.config.SYMBOLS_RANGE)
+            if self.symbol_manager is None:
+                self.symbol_manager = SymbolManager(self.config.MIN_VOLUME, proxy=self.config.PROXY)
+            # SymbolManager 是同步请求（含限流等待与重试退避），放到线程池执行，避免阻塞事件循环
+            symbols: List[str] = await asyncio.get_running_loop().run_in_executor(
+                None,
+                lambda: self.symbol_manager.get_top_gainers_symbols(*self.config.SYMBOLS_RANGE)
+            )
             symbols = [s for s in symbols if s not in self.black_symbols_full]
             if self.backtesting > 0:
                 symbols = self.config.BACK_TESTING_SYMBOLS
@@ -454,6 +460,9 @@ class TradingSignalBot:
                 logger.debug(f'已删除中文品种{symbol}')
             else:
                 triggered_symbols.append({'symbol': symbol, 'position_side': position_side})
+        # 本轮信号批量写入文件，update_signals 会读取当天的信号文件
+        if self.config.RECORDER_AVAILABLE:
+            self.config.signal_recorder.flush()
 
         self.signal_manager.update_signals(triggered_symbols, signal_accumulator,signal_txt_marker)
 
@@ -499,6 +508,7 @@ class TradingSignalBot:
                     'open_price': result['data'].iloc[-2]['close'],
                     'time_str': time_str,  # 使用K线开始时间的北京时间
                     'check_duplicate': check_duplicate,
+                    'autosave': False,  # 由扫描结束时统一 flush
                 }
 
                 success, message = self.config.signal_recorder.add_signal(**signal_params)
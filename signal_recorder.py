@@ -1,17 +1,47 @@
 # signal_recorder.py - 完整修复版本
 import json
 import os
+import shutil
+import time
+from collections import defaultdict, deque
 from datetime import datetime, timedelta
-from typing import Dict, List, Any, Tuple, Optional
+from typing import Dict, List, Any, Tuple, Optional, BinaryIO
 import logging
 logger = logging.getLogger(__name__)
 
+try:
+    import orjson
+
+    def _json_default(obj):
+        # numpy.float64 等 float 子类 orjson 不直接支持
+        if isinstance(obj, float):
+            return float(obj)
+        raise TypeError
+
+    def dumps_json(obj, indent: bool = False) -> bytes:
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=_json_default, option=option)
+
+    loads_json = orjson.loads
+except ImportError:
+    def dumps_json(obj, indent: bool = False) -> bytes:
+        if indent:
+            return json.dumps(obj, ensure_ascii=False, indent=2).encode('utf-8')
+        return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+    loads_json = json.loads
+
 
 class SignalRecorder:
     def __init__(self, hour,duplicate_window,data_dir: str = "signal_data"):
         """初始化信号记录器"""
         self.data_dir = data_dir
         self.history_dir = os.path.join(data_dir, "history")
+        # 预先拼好目录前缀，循环中直接拼接文件名
+        self._data_prefix = self.data_dir + os.sep
+        self._history_prefix = self.history_dir + os.sep
 
         self.hour = min(hour,24)
         # 创建目录
@@ -20,19 +50,25 @@ class SignalRecorder:
 
         # 当前文件
         self.current_date = datetime.now().strftime("%Y/%m/%d").replace("/", "-")
-        self.current_file = os.path.join(data_dir, f"{self.current_date}.json")
+        self.current_file = f"{self._data_prefix}{self.current_date}.json"
+        self._last_date_check = 0.0  # 上次检查日期变化的时间戳
 
         # 加载数据
-        self.data = self._load_or_init_data()
         self.duplicate_time_window = duplicate_window  # 防重复时间窗口(分钟)
+        self.data = self._load_or_init_data()
+        self._dirty = False  # 内存数据是否有未写入文件的修改
+        self._fp: Optional[BinaryIO] = None  # 当天文件的句柄，日期变化时关闭
+        # 每个symbol时间窗口内的信号，用于快速去重
+        self._recent: Dict[str, deque] = defaultdict(deque)
+        self._rebuild_recent()
         self._archive_old_signal_files()
 
     def _archive_old_signal_files(self):
         """
         将 signal_data 文件夹中非当天的 JSON 文件移动到 history 文件夹
         """
-        signal_data_dir = "signal_data"
-        history_dir = os.path.join(signal_data_dir, "history")
+        signal_data_dir = self.data_dir
+        history_dir = self.history_dir
 
         # 检查 signal_data 文件夹是否存在
         if not os.path.exists(signal_data_dir):
@@ -48,24 +84,19 @@ class SignalRecorder:
 
         # 遍历 signal_data 目录下的所有文件
         moved_count = 0
-        for filename in os.listdir(signal_data_dir):
-            # 只处理 JSON 文件
-            if not filename.endswith('.json'):
-                continue
-
-            file_path = os.path.join(signal_data_dir, filename)
+        with os.scandir(signal_data_dir) as entries:
+            files = [(entry.name, entry.path) for entry in entries
+                     # 只处理 JSON 文件，跳过 history 等目录（防止递归移动）
+                     if entry.name.endswith('.json') and entry.is_file()]
 
+        for filename, file_path in files:
             # 跳过今天的文件
             if filename == today_file:
                 continue
 
-            # 跳过已经存在的 history 文件夹（防止递归移动）
-            if os.path.isdir(file_path):
-                continue
-
             try:
                 # 目标路径
-                dest_path = os.path.join(history_dir, filename)
+                dest_path = self._history_prefix + filename
 
                 # 如果目标文件已存在，可以选择覆盖或跳过
                 # 这里选择跳过已存在的文件
@@ -73,51 +104,117 @@ class SignalRecorder:
                     logger.debug(f"文件已存在于 history 目录，跳过: {filename}")
                     continue
 
-                # 移动文件
-                import shutil
-                shutil.move(file_path, dest_path)
+                self._archive_file(file_path, dest_path)
                 moved_count += 1
                 logger.info(f"已归档信号文件: {filename} -> history/")
 
             except Exception as e:
                 logger.error(f"移动文件失败 {filename}: {e}")
 
+    @staticmethod
+    def _archive_file(file_path: str, dest_path: str):
+        """
+        归档单个信号文件：当天文件是紧凑格式，归档时重新按缩进格式写入，便于查看；
+        先写入 history 下的临时文件再 os.replace 到目标路径，中途出错不会留下半截的归档文件；
+        无法解析的文件原样移动
+        """
+        try:
+            with open(file_path, 'rb') as f:
+                content = loads_json(f.read())
+        except ValueError:
+            content = None
+
+        if content is not None:
+            tmp_path = dest_path + '.tmp'
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(dumps_json(content, indent=True))
+                os.replace(tmp_path, dest_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            os.remove(file_path)
+            return
+
+        # 移动文件（同一文件系统直接重命名，跨设备时退化为复制+删除）
+        try:
+            os.replace(file_path, dest_path)
+        except OSError:
+            shutil.move(file_path, dest_path)
+
     def _load_or_init_data(self) -> Dict[str, Any]:
         """加载或初始化数据"""
         if os.path.exists(self.current_file):
             try:
-                with open(self.current_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                with open(self.current_file, 'rb') as f:
+                    data = loads_json(f.read())
                     return data
             except Exception as e:
                 logger.error(f"加载信号文件失败: {e}")
                 return {}
         return {}
 
-    def _check_date_change(self, archive_old: bool = True):
+    def _check_date_change(self, archive_old: bool = True, now: Optional[float] = None):
         """
-        检查日期变化
+        检查日期变化（同一秒内只检查一次）
+
+        Args:
+            archive_old: 是否归档旧文件
+            now: 调用方已获取的当前时间戳，避免重复取时间
         """
-        today_str = datetime.now().strftime("%Y/%m/%d").replace("/", "-")
+        if now is None:
+            now = time.time()
+        if now - self._last_date_check < 1.0:
+            return
+        self._last_date_check = now
+        today_str = time.strftime("%Y-%m-%d", time.localtime(now))
 
         if today_str != self.current_date:
-            # 保存当前数据
-            if self.data:
-                self.save()
-
-            if archive_old and os.path.exists(self.current_file) and self.data:
-                # 归档旧文件到history目录
-                archive_file = os.path.join(self.history_dir, os.path.basename(self.current_file))
+            if archive_old and self.data:
+                self.close()
+                # 归档到history目录（归档文件带缩进，便于查看）
+                archive_file = f"{self._history_prefix}{self.current_date}.json"
                 try:
-                    os.replace(self.current_file, archive_file)
+                    self.save(archive_file, indent=True)
+                    if os.path.exists(self.current_file):
+                        os.remove(self.current_file)
                     logger.info(f"已归档文件到: {archive_file}")
                 except Exception as e:
                     logger.error(f"归档文件失败: {e}")
+                    self.flush()
+            else:
+                # 保存当前数据
+                self.flush()
 
             # 创建新文件
+            self.close()
             self.current_date = today_str
-            self.current_file = os.path.join(self.data_dir, f"{self.current_date}.json")
+            self.current_file = f"{self._data_prefix}{self.current_date}.json"
             self.data = {}
+            self._recent.clear()
+
+    def _rebuild_recent(self):
+        """根据已加载的数据重建去重窗口（以各symbol最新信号时间为基准）"""
+        self._recent.clear()
+        window = self.duplicate_time_window * 60
+        for symbol, symbol_data in self.data.items():
+            signals = symbol_data.get("signals", [])
+            stamped = [(ts, signal) for signal in signals
+                       if (ts := self._signal_ts(signal)) is not None]
+            if not stamped:
+                continue
+            latest = max(ts for ts, _ in stamped)
+            self._recent[symbol].extend(signal for ts, signal in stamped if ts > latest - window)
+
+    def _prune_recent(self, symbol: str, current_ts: int):
+        """移除去重窗口之外的旧信号"""
+        recent = self._recent.get(symbol)
+        if not recent:
+            return
+        cutoff = current_ts - self.duplicate_time_window * 60
+        while recent and recent[0]["ts"] <= cutoff:
+            recent.popleft()
 
     def add_signal(self, **kwargs) -> Tuple[bool, str]:
         """
@@ -125,7 +222,8 @@ class SignalRecorder:
 
         Args:
             **kwargs: 必须包含 symbol, interval, position_side, open_price
-                     可选: time_str, check_duplicate
+                     可选: time_str, check_duplicate,
+                     autosave(默认True，为False时只标记待写入，由flush统一保存)
         """
         # 检查必要参数
         required_params = ['symbol', 'interval', 'position_side', 'open_price']
@@ -140,21 +238,25 @@ class SignalRecorder:
         open_price = kwargs['open_price']
         time_str = kwargs.get('time_str')  # 可选，默认None
         check_duplicate = kwargs.get('check_duplicate', True)  # 可选，默认True
+        autosave = kwargs.get('autosave', True)  # 可选，默认True
 
-        # 检查日期变化
-        self._check_date_change()
+        # 检查日期变化（本次调用只取一次当前时间）
+        now = time.time()
+        self._check_date_change(now=now)
 
         # 获取当前时间
         if time_str is None:
-            time_str = datetime.now()
+            time_str = datetime.fromtimestamp(now)
         elif isinstance(time_str, str):
             # 如果传入的是字符串，转换为datetime对象
             time_str = datetime.strptime(time_str, "%Y/%m/%d %H:%M:%S")
+        ts = int(time_str.timestamp())
+        self._prune_recent(symbol, ts)
 
         # 检查重复信号
         if check_duplicate:
             # 首先检查是否为重复信号（相同类型、相似价格）
-            if self._is_duplicate_signal(symbol, open_price, time_str):
+            if self._is_duplicate_signal(symbol, open_price, ts):
                 return False, f"重复信号: {symbol} 价格: {open_price}"
 
         # 初始化symbol的数据结构
@@ -163,9 +265,10 @@ class SignalRecorder:
                 "signals": []
             }
 
-        # 创建信号记录
+        # 创建信号记录（open_time 与 update_time 共用同一个字符串）
+        open_time = time_str.strftime("%Y/%m/%d %H:%M:%S")
         signal_record = {
-            "open_time": time_str.strftime("%Y/%m/%d %H:%M:%S"),
+            "open_time": open_time,
             "open_price": open_price,
             "after_close_time": (time_str + timedelta(hours=self.hour)).strftime("%Y/%m/%d %H:%M:%S"),
             "after_high_price": 0.0,
@@ -174,27 +277,69 @@ class SignalRecorder:
             "rate_of_down_change": '',
             "interval":interval,
             "position_side":position_side,
-            "update_time": time_str.strftime("%Y/%m/%d %H:%M:%S")
+            "update_time": open_time,
+            "ts": ts
 
         }
 
         # 添加到信号列表
         self.data[symbol]["signals"].append(signal_record)
+        self._recent[symbol].append(signal_record)
 
         # 保存到文件
-        self.save()
+        self._dirty = True
+        if autosave:
+            self.save()
 
         msg = f"已记录信号: {symbol} - 价格: {open_price}"
         logger.debug(msg)
         return True, msg
 
-    def save(self):
-        """保存数据"""
+    def save(self, file_path: Optional[str] = None, indent: bool = False):
+        """
+        保存数据
+
+        Args:
+            file_path: 目标文件，默认为当天文件
+            indent: 是否缩进输出（仅归档时使用，日常保存为紧凑格式）
+        """
         try:
-            with open(self.current_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, indent=4, ensure_ascii=False)
+            if file_path:
+                with open(file_path, 'wb') as f:
+                    f.write(dumps_json(self.data, indent=indent))
+            else:
+                fp = self._get_fp()
+                fp.seek(0)
+                fp.write(dumps_json(self.data, indent=indent))
+                fp.truncate()
+                fp.flush()
+            self._dirty = False
         except Exception as e:
             logger.error(f"保存信号文件失败: {e}")
+            if file_path:
+                raise
+            self.close()
+
+    def _get_fp(self) -> BinaryIO:
+        """获取当天文件的句柄（保持打开，避免每次保存都重新打开文件）"""
+        if self._fp is None:
+            mode = 'r+b' if os.path.exists(self.current_file) else 'w+b'
+            self._fp = open(self.current_file, mode)
+        return self._fp
+
+    def close(self):
+        """关闭当天文件的句柄"""
+        if self._fp is not None:
+            try:
+                self._fp.close()
+            except OSError as e:
+                logger.error(f"关闭信号文件失败: {e}")
+            self._fp = None
+
+    def flush(self):
+        """将未保存的修改写入文件（批量记录信号后调用）"""
+        if self._dirty:
+            self.save()
 
     def load_history_file(self, date_str: str) -> Dict[str, Any]:
         """
@@ -207,68 +352,61 @@ class SignalRecorder:
             Dict: 历史数据
         """
         # 先尝试从history目录加载
-        history_file = os.path.join(self.history_dir, f"{date_str}.json")
+        history_file = f"{self._history_prefix}{date_str}.json"
         if os.path.exists(history_file):
             try:
-                with open(history_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(history_file, 'rb') as f:
+                    return loads_json(f.read())
             except Exception as e:
                 logger.error(f"加载历史文件失败: {e}")
 
         # 尝试从当前目录加载
-        current_file = os.path.join(self.data_dir, f"{date_str}.json")
+        current_file = f"{self._data_prefix}{date_str}.json"
         if os.path.exists(current_file):
             try:
-                with open(current_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(current_file, 'rb') as f:
+                    return loads_json(f.read())
             except Exception as e:
                 logger.error(f"加载文件失败: {e}")
 
         logger.warning(f"未找到日期为 {date_str} 的文件")
         return {}
 
-    def _is_duplicate_signal(self, symbol: str, open_price: float, time_str: str) -> bool:
+    @staticmethod
+    def _signal_ts(signal: Dict[str, Any]) -> Optional[int]:
+        """获取信号的时间戳(秒)，旧记录缺少 ts 时按 open_time 回填"""
+        ts = signal.get("ts")
+        if ts is None:
+            try:
+                ts = int(datetime.strptime(signal["open_time"], "%Y/%m/%d %H:%M:%S").timestamp())
+            except (KeyError, TypeError, ValueError):
+                return None
+            signal["ts"] = ts
+        return ts
+
+    def _is_duplicate_signal(self, symbol: str, open_price: float, current_ts: int) -> bool:
         """
         检查是否为重复信号
 
         Args:
             symbol: 交易对
             open_price: 开仓价格
-            time_str: 时间字符串
+            current_ts: 信号时间戳(秒)
 
         Returns:
             bool: 是否为重复信号
         """
-        if symbol not in self.data:
+        recent = self._recent.get(symbol)
+        if not recent:
             return False
 
-        # 转换时间字符串为datetime对象
-        try:
-            current_time = datetime.strptime(time_str, "%Y/%m/%d %H:%M:%S")
-        except:
-            # 如果时间格式不正确，使用当前时间
-            current_time = datetime.now()
-
-        # 获取该symbol的所有信号
-        signals = self.data[symbol].get("signals", [])
-
-        for signal in signals[::-1]:  # 从最新的开始检查
-            # 检查时间差
-            try:
-                signal_time = datetime.strptime(signal["open_time"], "%Y/%m/%d %H:%M:%S")
-            except:
-                continue
-
-            time_diff = (current_time - signal_time).total_seconds() / 60  # 转换为分钟
-
-            # 如果在时间窗口内，检查是否为重复
-            if time_diff <= self.duplicate_time_window:
+        window = self.duplicate_time_window * 60  # 转换为秒
+        for signal in reversed(recent):  # 从最新的开始检查
+            # 如果在时间窗口内，检查是否为重复（下一根K线正好相隔一个窗口，不算重复）
+            if current_ts - signal["ts"] < window:
                 # 检查价格是否相近（避免微小波动重复记录）
-                price_diff = abs(open_price - signal["open_price"]) / signal["open_price"]
-                if price_diff < 0.01:  # 价格差异小于1%
+                signal_price = signal["open_price"]
+                if abs(open_price - signal_price) < 0.01 * signal_price:  # 价格差异小于1%
                     return True
 
         return False
-
-
-
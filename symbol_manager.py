@@ -5,38 +5,132 @@ symbol_manager_fixed.py - 币安交易对管理器（修复版）
 """
 
 from binance.um_futures import UMFutures
+from binance.error import ClientError
+from requests.adapters import HTTPAdapter
+import heapq
 import json
 import logging
-from typing import List, Dict, Any, Optional
-from datetime import datetime
-import pytz
+import os
+import random
+from typing import List, Dict, Any, Optional, Callable
+from datetime import datetime, timezone, timedelta
 import time
 from config import Config
+import pandas as pd
 
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-# 北京时间时区
-BEIJING_TZ = pytz.timezone('Asia/Shanghai')
+# 北京时间时区（无夏令时，固定UTC+8）
+BEIJING_TZ = timezone(timedelta(hours=8))
+# 交易所信息很少变化，缓存1小时；24小时行情缓存几秒，供连续调用共用
+EXCHANGE_INFO_TTL = 3600
+TICKER_24HR_TTL = 5
+# 币安合约接口每分钟权重上限及各接口权重
+WEIGHT_LIMIT_1M = 2400
+EXCHANGE_INFO_WEIGHT = 1
+TICKER_24HR_WEIGHT = 40  # 不带symbol参数时为40
+RATE_LIMIT_STATUS = (418, 429)
+# 同步请求最多在限流器里等待的秒数，超过则本次放弃，由下次扫描再请求，避免长时间卡住扫描
+MAX_SYNC_WAIT = 1.0
+# 失败重试的退避基数（秒），第n次重试等待 [0, RETRY_BASE_DELAY * 2**n) 内的随机时间
+RETRY_BASE_DELAY = 1.0
+# 24小时行情字段 -> 筛选结果字段
+TICKER_FIELDS = {
+    'priceChangePercent': 'price_change_percent',
+    'quoteVolume': 'quote_volume',
+    'lastPrice': 'last_price',
+    'highPrice': 'high_price',
+    'lowPrice': 'low_price',
+    'volume': 'volume',
+}
+
+
+class RateLimitError(Exception):
+    """本地限流器要求等待的时间过长，本次不发请求"""
+
+
+class WeightLimiter:
+    """
+    按分钟窗口统计请求权重，并用响应头 x-mbx-used-weight-1m 校准，
+    超出上限或被限流(429/418)时等待到窗口重置 / Retry-After 之后再请求
+    """
+
+    def __init__(self, capacity: int = WEIGHT_LIMIT_1M):
+        self.capacity = capacity
+        self.used = 0
+        self.minute = int(time.time() // 60)
+        self.blocked_until = 0.0
+
+    def reserve(self, weight: int, max_wait: float = float('inf')) -> float:
+        """
+        预占权重，返回发请求前需要等待的秒数；
+        需要等待超过 max_wait 秒时不预占，由调用方放弃本次请求
+        """
+        now = time.time()
+        wait = max(0.0, self.blocked_until - now)
+        if wait > max_wait:
+            return wait
+        minute = int((now + wait) // 60)
+        if minute != self.minute:
+            self.minute = minute
+            self.used = 0
+        if self.used + weight > self.capacity:
+            # 等到下一分钟窗口
+            wait = (minute + 1) * 60 - now
+            if wait > max_wait:
+                return wait
+            self.minute = minute + 1
+            self.used = 0
+        self.used += weight
+        return wait
+
+    def update(self, used_weight: Optional[str]):
+        """用服务端返回的已用权重校准本地计数"""
+        if used_weight is None:
+            return
+        try:
+            used = int(used_weight)
+        except (TypeError, ValueError):
+            return
+        if int(time.time() // 60) == self.minute:
+            self.used = max(self.used, used)
+
+    def block(self, retry_after: Optional[str]):
+        """被限流后按 Retry-After 暂停请求"""
+        try:
+            seconds = float(retry_after)
+        except (TypeError, ValueError):
+            seconds = 60.0
+        self.blocked_until = max(self.blocked_until, time.time() + seconds)
+        logger.warning(f"⚠️ 触发币安限流，{seconds:.0f} 秒后再请求")
 
 
 class SymbolManager:
-    def __init__(self, min_volume: float = 10000000):
+    # 属性固定，不需要实例 __dict__
+    __slots__ = (
+        'proxies', 'min_volume', 'client',
+        'trading_symbols', 'filtered_symbols', 'last_update_time',
+        '_exchange_info_ts', '_ticker_cache', '_ticker_ts', '_24hr_snapshot',
+        '_limiter',
+    )
+
+    def __init__(self, min_volume: float = 10000000, proxy: Optional[str] = None):
         """
         初始化币安交易分析器
         
         Args:
-            proxies: 代理设置
             min_volume: 最小成交额筛选条件，默认1000万USDT
+            proxy: 代理地址，如 http://127.0.0.1:7890；不指定时读取环境变量 HTTPS_PROXY，都没有则直连
         """
-        self.proxies = {
-            "http": "http://127.0.0.1:7890",
-            "https": "http://127.0.0.1:7890"
-        }
+        proxy = proxy or os.environ.get('HTTPS_PROXY') or os.environ.get('https_proxy')
+        self.proxies = {"http": proxy, "https": proxy} if proxy else {}
         self.min_volume = min_volume
         
         try:
-            self.client = UMFutures(proxies=self.proxies)
+            # show_limit_usage 让响应带上 x-mbx-used-weight-1m，由 _call 解包
+            self.client = UMFutures(proxies=self.proxies or None, show_limit_usage=True)
+            self._configure_session()
             logger.info(f"✅ 交易对管理器初始化成功,最小成交量为{min_volume}")
         except Exception as e:
             logger.error(f"❌ 交易对管理器初始化失败: {e}")
@@ -45,52 +139,123 @@ class SymbolManager:
         self.trading_symbols = []
         self.filtered_symbols = []
         self.last_update_time = None
-    def get_trading_symbols(self, max_retries: int = 3) -> List[str]:
+        self._exchange_info_ts = 0.0
+        self._ticker_cache = None
+        self._ticker_ts = 0.0
+        # 筛选结果快照 (时间, min_volume, 数据)，同一时刻多次调用共用
+        self._24hr_snapshot = None
+        self._limiter = WeightLimiter()
+
+    def _call(self, endpoint_fn, weight: int, **kwargs) -> Any:
+        """经权重限流器调用UMFutures接口，返回数据部分"""
+        wait = self._limiter.reserve(weight, MAX_SYNC_WAIT)
+        if wait > MAX_SYNC_WAIT:
+            raise RateLimitError(f"权重限流中，需等待 {wait:.0f} 秒")
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            response = endpoint_fn(**kwargs)
+        except ClientError as e:
+            if e.status_code in RATE_LIMIT_STATUS:
+                self._limiter.block((e.header or {}).get('Retry-After'))
+            raise
+        self._limiter.update(response.get('limit_usage', {}).get('x-mbx-used-weight-1m'))
+        return response['data']
+
+    @staticmethod
+    def _is_rate_limited(error: Exception) -> bool:
+        """是否为限流错误（限流期间重试没有意义，直接放弃）"""
+        if isinstance(error, RateLimitError):
+            return True
+        if isinstance(error, ClientError):
+            return error.status_code in RATE_LIMIT_STATUS
+        return False
+
+    @staticmethod
+    def _backoff(attempt: int, base: float) -> float:
+        """重试前的等待时间：全抖动指数退避，避免多个进程同时重试"""
+        return random.uniform(0, base * 2 ** attempt)
+
+    def _retry(self, fn: Callable[[], Any], desc: str,
+               max_retries: int = 3, base: float = RETRY_BASE_DELAY) -> Any:
+        """
+        调用 fn，失败时退避后重试，最后一次仍失败则抛出异常；
+        限流错误不重试，直接抛出，由下次扫描再请求
+
+        Args:
+            fn: 无参调用
+            desc: 日志中的操作描述
+            max_retries: 最大尝试次数
+            base: 退避基数（秒），传0则不等待
+        """
+        for attempt in range(max_retries):
+            try:
+                return fn()
+            except Exception as e:
+                logger.warning(f"{desc}失败 (尝试 {attempt + 1}/{max_retries}): {e}")
+                if attempt == max_retries - 1 or self._is_rate_limited(e):
+                    raise
+                time.sleep(self._backoff(attempt, base))
+
+    def _configure_session(self):
+        """复用UMFutures内部的requests.Session：挂载连接池并保持长连接"""
+        session = getattr(self.client, 'session', None)
+        if session is None:
+            return
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=0)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers['Connection'] = 'keep-alive'
+        # 代理设置在session上，所有请求共用同一个代理连接池（大小同样由上面的adapter决定）；
+        # 无代理时不设置，直接复用到币安的连接池
+        if self.proxies:
+            session.proxies.update(self.proxies)
+
+    def get_trading_symbols(self, max_retries: int = 3, force_refresh: bool = False) -> List[str]:
         """
         获取所有可交易状态的USDT交易对
         
         Args:
             max_retries: 最大重试次数
+            force_refresh: 忽略缓存，强制重新请求交易所信息
             
         Returns:
             可交易状态的所有USDT交易对列表
         """
-        self.trading_symbols = []
-        
-        for attempt in range(max_retries):
-            try:
-                exchange_info = self.client.exchange_info()
-                symbols = exchange_info.get('symbols', [])
-                
-                for symbol_info in symbols:
-                    try:
-                        symbol = symbol_info.get('symbol', '')
-                        status = symbol_info.get('status', '')
-                        deliveryDate = symbol_info.get('deliveryDate')  #交割日期必须大于一个月
-
-                        quote_asset = symbol_info.get('quoteAsset', '')
-                        
-                        # 检查是否为可交易的USDT交易对
-                        if (status == 'TRADING' and 
-                            symbol.endswith('USDT') and 
-                            quote_asset == 'USDT' and deliveryDate >= Config.ONE_MONTH_LATER):
-                            self.trading_symbols.append(symbol)
-                    except Exception as e:
-                        logger.debug(f"处理交易对信息时出错: {e}")
-                        continue
-                
-                logger.info(f"✅ 获取到 {len(self.trading_symbols)} 个可交易USDT交易对")
-                self.last_update_time = datetime.now(BEIJING_TZ)
-                return self.trading_symbols
-                
-            except Exception as e:
-                logger.warning(f"获取交易对信息失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)  # 指数退避
-                else:
-                    logger.error(f"获取交易对信息最终失败: {e}")
-                    return []
+        if (not force_refresh and self.trading_symbols
+                and time.time() - self._exchange_info_ts < EXCHANGE_INFO_TTL):
+            return self.trading_symbols
+
+        try:
+            exchange_info = self._retry(
+                lambda: self._call(self.client.exchange_info, EXCHANGE_INFO_WEIGHT),
+                "获取交易对信息", max_retries)
+        except Exception as e:
+            # 刷新失败时保留上次的列表（缓存时间不更新，下次调用会再次尝试）
+            logger.error(f"获取交易对信息最终失败: {e}")
+            return self.trading_symbols
+        return self._set_trading_symbols(exchange_info)
     
+    def _set_trading_symbols(self, exchange_info: Dict[str, Any]) -> List[str]:
+        """解析交易所信息，成功后才替换可交易USDT交易对列表及缓存时间"""
+        min_delivery = Config.ONE_MONTH_LATER  #交割日期必须大于一个月
+        try:
+            # 可交易的USDT交易对（quoteAsset为USDT的交易对名称必以USDT结尾）
+            symbols = [
+                s['symbol'] for s in exchange_info.get('symbols', [])
+                if s.get('status') == 'TRADING' and s.get('quoteAsset') == 'USDT'
+                and (s.get('deliveryDate') or 0) >= min_delivery
+            ]
+        except Exception as e:
+            logger.debug(f"处理交易对信息时出错: {e}")
+            return self.trading_symbols
+
+        self.trading_symbols = symbols
+        logger.info(f"✅ 获取到 {len(self.trading_symbols)} 个可交易USDT交易对")
+        self.last_update_time = datetime.now(BEIJING_TZ)
+        self._exchange_info_ts = time.time()
+        return self.trading_symbols
+
     def get_24hr_trading_data(self, max_retries: int = 3) -> List[Dict[str, Any]]:
         """
         获取24小时交易数据，并筛选符合成交额条件的交易对
@@ -98,53 +263,60 @@ class SymbolManager:
         Returns:
             筛选后的交易对数据列表，包含symbol、百分比、成交额
         """
-        if not self.trading_symbols:
-            self.get_trading_symbols()
-        
-        filtered_data = []
-        for attempt in range(max_retries):
-            try:
-                tickers = self.client.ticker_24hr_price_change()  #x-mbx-used-weight-1m 40
-                
-                # 转换为字典便于快速查找
-                ticker_dict = {ticker.get('symbol'): ticker for ticker in tickers}
-                
-                for symbol in self.trading_symbols:
-                    ticker = ticker_dict.get(symbol)
-                    if ticker:
-                        try:
-                            quote_volume = float(ticker.get('quoteVolume', 0))
-                            
-                            # 筛选成交额大于阈值的交易对
-                            if quote_volume >= self.min_volume:
-                                data = {
-                                    'symbol': symbol,
-                                    'price_change_percent': float(ticker.get('priceChangePercent', 0)),
-                                    'quote_volume': quote_volume,
-                                    'last_price': float(ticker.get('lastPrice', 0)),
-                                    'high_price': float(ticker.get('highPrice', 0)),
-                                    'low_price': float(ticker.get('lowPrice', 0)),
-                                    'volume': float(ticker.get('volume', 0))
-                                }
-                                filtered_data.append(data)
-                        except (ValueError, TypeError) as e:
-                            logger.debug(f"处理交易对 {symbol} 数据时出错: {e}")
-                            continue
-                
-                # 按成交额降序排序
-                filtered_data.sort(key=lambda x: x['quote_volume'], reverse=True)
-                
-                logger.info(f"✅ 筛选到 {len(filtered_data)} 个成交额大于 {self.min_volume:,.0f} USDT的交易对")
-                return filtered_data
-                
-            except Exception as e:
-                logger.warning(f"获取24小时交易数据失败 (尝试 {attempt + 1}/{max_retries}): {e}")
-                if attempt < max_retries - 1:
-                    time.sleep(2 ** attempt)
-                else:
-                    logger.error(f"获取24小时交易数据最终失败: {e}")
-                    return []
+        # 缓存未过期时直接返回，过期后重新请求交易所信息
+        self.get_trading_symbols()
+
+        # get_top_symbols / get_top_gainers_symbols 等连续调用时直接复用上次筛选结果
+        snapshot = self._24hr_snapshot
+        if (snapshot is not None and time.time() - snapshot[0] < TICKER_24HR_TTL
+                and snapshot[1] == self.min_volume):
+            return snapshot[2]
+
+        try:
+            tickers = self._retry(self._get_ticker_24hr, "获取24小时交易数据", max_retries)
+            data = self._filter_24hr(tickers)
+            self._24hr_snapshot = (self._ticker_ts, self.min_volume, data)
+            return data
+        except Exception as e:
+            logger.error(f"获取24小时交易数据最终失败: {e}")
+            return []
     
+    def _filter_24hr(self, tickers: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """从24小时行情中筛选成交额达标的可交易交易对，按成交额降序（成交额相同时按交易对列表顺序）"""
+        df = pd.DataFrame(tickers)
+        if df.empty or 'symbol' not in df.columns:
+            filtered_data = []
+        else:
+            df = df.drop_duplicates('symbol', keep='last')
+            # 只保留可交易交易对，并按交易对列表顺序排列
+            position = df['symbol'].map({symbol: i for i, symbol in enumerate(self.trading_symbols)})
+            df = df[position.notna()].iloc[position.dropna().argsort(kind='stable')]
+
+            result = pd.DataFrame({'symbol': df['symbol']})
+            for field, name in TICKER_FIELDS.items():
+                # 缺失值按0处理，只丢弃无法解析的值所在的行
+                column = df[field].fillna(0) if field in df.columns else 0
+                result[name] = pd.to_numeric(column, errors='coerce')
+            result = result.dropna().astype({name: 'float64' for name in TICKER_FIELDS.values()})
+            result = result[result['quote_volume'] >= self.min_volume]
+
+            # 按成交额降序排序
+            result = result.sort_values('quote_volume', ascending=False, kind='stable')
+            filtered_data = result.to_dict('records')
+
+        logger.info(f"✅ 筛选到 {len(filtered_data)} 个成交额大于 {self.min_volume:,.0f} USDT的交易对")
+        return filtered_data
+
+    def _get_ticker_24hr(self) -> List[Dict[str, Any]]:
+        """获取24小时行情，TICKER_24HR_TTL 秒内的重复调用共用同一份结果"""
+        now = time.time()
+        if self._ticker_cache is not None and now - self._ticker_ts < TICKER_24HR_TTL:
+            return self._ticker_cache
+        tickers = self._call(self.client.ticker_24hr_price_change, TICKER_24HR_WEIGHT)
+        self._ticker_cache = tickers
+        self._ticker_ts = now
+        return tickers
+
     def get_filtered_symbols(self, min_volume: Optional[float] = None) -> List[str]:
         """
         获取筛选后的交易对符号列表
@@ -193,40 +365,33 @@ class SymbolManager:
         return [item['symbol'] for item in trading_data[:top_n]]
     
     def refresh(self):
-        """刷新数据"""
-        self.trading_symbols = []
+        """刷新数据（交易对列表在请求成功后才替换）"""
         self.filtered_symbols = []
-        self.get_trading_symbols()
+        self._ticker_cache = None
+        self._24hr_snapshot = None
+        self.get_trading_symbols(force_refresh=True)
 
     def get_top_gainers_symbols(self, start_rank: int = 10, end_rank: int = 19) -> List[str]:
         """
         获取涨幅榜指定排名区间的交易对名称列表
         """
         try:
-            # 获取数据
+            # 获取数据（已筛选为成交额达标的USDT交易对，涨幅已转为float）
             tickers = self.get_24hr_trading_data()
-            # 筛选并排序
-            usdt_tickers = []
-            for ticker in tickers:
-                symbol = ticker.get('symbol', '')
-                if symbol.endswith('USDT'):
-                    try:
-                        price_change = float(ticker.get('price_change_percent', 0))
-                        usdt_tickers.append((symbol, price_change))
-                    except:
-                        continue
-
-            # 按涨幅排序
-            usdt_tickers.sort(key=lambda x: x[1], reverse=True)
+            # 只取涨幅前 end_rank 名，无需整体排序
+            top = heapq.nlargest(max(end_rank, 0), tickers, key=lambda t: t['price_change_percent'])
             # 提取指定排名区间的symbol
             start_idx = max(0, start_rank - 1)
-            end_idx = min(end_rank, len(usdt_tickers))
 
-            return [symbol for symbol, _ in usdt_tickers[start_idx:end_idx]]
+            return [ticker['symbol'] for ticker in top[start_idx:]]
 
         except Exception as e:
             logger.error(f"获取涨幅榜失败: {e}")
             return []
+_beijing_time_sec = 0
+_beijing_time_str = ''
+
+
 def get_current_beijing_time() -> str:
     """
     获取当前北京时间
@@ -234,8 +399,14 @@ def get_current_beijing_time() -> str:
     Returns:
         格式化的北京时间字符串: "2025-12-13 19:43:16"
     """
-    now = datetime.now(BEIJING_TZ)
-    return now.strftime("%Y-%m-%d %H:%M:%S")
+    global _beijing_time_sec, _beijing_time_str
+    now = time.time()
+    sec = int(now)
+    # 同一秒内直接返回上次格式化的结果
+    if sec != _beijing_time_sec:
+        _beijing_time_str = datetime.fromtimestamp(sec, BEIJING_TZ).strftime("%Y-%m-%d %H:%M:%S")
+        _beijing_time_sec = sec
+    return _beijing_time_str
 
 
 if __name__ == "__main__":
@@ -5,7 +5,9 @@ import logging
 from datetime import datetime, timezone, timedelta
 from binance.um_futures import UMFutures
 import os
+import sys
 
+logger = logging.getLogger(__name__)
 
 
 def get_server_time_ms():
@@ -106,7 +108,12 @@ def get_active_window_info():
 
 # 实时监控活动窗口变化
 def monitor_active_window(interval=1):
-    """监控活动窗口变化"""
+    """
+    监控活动窗口变化
+    Windows 下注册前台窗口切换事件钩子，窗口切换时才被唤醒；其他平台按 interval 秒轮询
+    """
+    if sys.platform == 'win32' and _monitor_foreground_events():
+        return
     last_title = None
 
     while True:
@@ -117,22 +124,70 @@ def monitor_active_window(interval=1):
         time.sleep(interval)
 
 
+def _monitor_foreground_events():
+    """
+    用 SetWinEventHook(EVENT_SYSTEM_FOREGROUND) 监听前台窗口切换并阻塞处理消息
+    注册钩子失败时返回 False，由调用方退回轮询
+    """
+    import ctypes
+    from ctypes import wintypes
+
+    user32 = ctypes.windll.user32
+    EVENT_SYSTEM_FOREGROUND = 0x0003
+    WINEVENT_OUTOFCONTEXT = 0x0000
+
+    WinEventProc = ctypes.WINFUNCTYPE(
+        None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND,
+        wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD
+    )
+    user32.SetWinEventHook.restype = wintypes.HANDLE
+    user32.SetWinEventHook.argtypes = [
+        wintypes.DWORD, wintypes.DWORD, wintypes.HMODULE, WinEventProc,
+        wintypes.DWORD, wintypes.DWORD, wintypes.DWORD
+    ]
+
+    last_title = None
+
+    def on_foreground(hook, event, hwnd, id_object, id_child, thread_id, event_time):
+        nonlocal last_title
+        length = user32.GetWindowTextLengthW(hwnd)
+        buffer = ctypes.create_unicode_buffer(length + 1)
+        user32.GetWindowTextW(hwnd, buffer, length + 1)
+        if buffer.value != last_title:
+            last_title = buffer.value
+
+    # 回调对象需保持引用，否则会被回收
+    callback = WinEventProc(on_foreground)
+    hook = user32.SetWinEventHook(EVENT_SYSTEM_FOREGROUND, EVENT_SYSTEM_FOREGROUND,
+                                  0, callback, 0, 0, WINEVENT_OUTOFCONTEXT)
+    if not hook:
+        return False
+
+    msg = wintypes.MSG()
+    try:
+        # GetMessageW 在没有事件时阻塞，不占用CPU
+        while user32.GetMessageW(ctypes.byref(msg), 0, 0, 0) > 0:
+            user32.TranslateMessage(ctypes.byref(msg))
+            user32.DispatchMessageW(ctypes.byref(msg))
+    finally:
+        user32.UnhookWinEvent(hook)
+    return True
+
+
 
 
 def async_timer_decorator(func):
+    name = func.__name__
+
     @wraps(func)
     async def wrapper(self, *args, **kwargs):  # 注意 self 参数
-        start_time = time.time()
+        # perf_counter 单调递增、精度高，不受系统校时影响
+        start_time = time.perf_counter()
         result = await func(self, *args, **kwargs)
-        end_time = time.time()
-
-        # 尝试从实例获取 logger
-        if hasattr(self, 'logger'):
-            self.logger.info(f"{func.__name__} 运行时间: {end_time - start_time:.2f} 秒")
-        else:
-            # 如果没有 logger，使用 print 作为后备
-            logger = logging.getLogger(__name__)
-            logger.info(f"{func.__name__} 运行时间: {end_time - start_time:.2f} 秒")
+        elapsed = time.perf_counter() - start_time
+
+        # 优先使用实例的 logger，没有则使用模块 logger
+        getattr(self, 'logger', logger).info(f"{name} 运行时间: {elapsed:.2f} 秒")
 
         return result
 